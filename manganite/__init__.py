@@ -1,12 +1,15 @@
 import shutil
 import tempfile
+import threading
 import weakref
 from html import escape
 from textwrap import dedent
 
 import panel as pn
 
+from . import metrics
 from .grid import Grid
+from .scheduler import scheduler
 
 __version__ = '0.0.5'
 
@@ -39,12 +42,20 @@ class Manganite:
         description = kwargs.pop('description', None)
 
         if pn.state.curdoc: # shared environment
-            Manganite._server_instances[pn.state.curdoc] = self
+            doc = pn.state.curdoc
+            Manganite._server_instances[doc] = self
+
+            def cleanup(session_context):
+                Manganite._server_instances.pop(doc, None)
+                scheduler.cancel(doc)
+            doc.on_session_destroyed(cleanup)
         else: # running in JupyterLab
             Manganite._nb_instance = self
 
         self._upload_dir = tempfile.mkdtemp(prefix='mnn_uploads__')
         self._finalizer = weakref.finalize(self, shutil.rmtree, self._upload_dir)
+        # notebook globals, set by CellManager
+        self._namespace = None
 
         self._init_terminal()
         self._init_debugger()
@@ -80,6 +91,10 @@ class Manganite:
             margin=(0, 0),
             stylesheets=[':host { width: 75vw; max-width: 150ch; }'])
 
+        # when serving, the layout is built without a document
+        # and attached to it at once by `finalize()`,
+        # after the initial run of the notebook
+        self._attached = not pn.state.curdoc
         self._template = pn.template.MaterialTemplate(
             collapsed_sidebar=True,
             header=[self._header],
@@ -88,8 +103,10 @@ class Manganite:
             main=[self._tabs],
             sidebar_width=SIDEBAR_OUTER_WIDTH,
             modal=[self._modal],
-            title=title
-        ).servable()
+            title=title)
+
+        if self._attached:
+            self._template.servable()
 
 
     def _init_terminal(self):
@@ -123,9 +140,19 @@ class Manganite:
     def get_tab(self, name):
         if name not in self._layout:
             self._layout[name] = Grid()
-            self._tabs.append((name, self._layout[name]))
+            if self._attached:
+                self._tabs.append((name, self._layout[name]))
         
         return self._layout[name]
+
+
+    def finalize(self):
+        if self._attached:
+            return
+
+        self._tabs.extend([(name, layout) for name, layout in self._layout.items() if name != 'Description'])
+        self._template.servable()
+        self._attached = True
     
 
     def get_header(self):
@@ -142,6 +169,7 @@ class Manganite:
             line_number = 1
         else:
             location = 'cell {}, line {}'.format(cell_number, line_number)
+        metrics.exceptions.inc(error_class=error_class)
         preview_title = '{} in {}: {}'.format(error_class, location, escape(error_message))
         notification_content = '{}<br><small>{}</small>'.format(error_class, location)
 
@@ -200,6 +228,24 @@ def init(*args, **kwargs):
     return mnn
 
 
+def finalize():
+    Manganite.get_instance().finalize()
+
+
+# set by CellManager in the thread running a `%%mnn execute` cell
+_process_context = threading.local()
+
+
+# lets a running `%%mnn execute` cell show intermediate results:
+# `publish(value)` assigns `value` to the variable named in `--returns`,
+# `publish()` reuses its current value, and in both cases dependent cells
+# are re-evaluated in the background; outside of a process this is a no-op
+def publish(*value):
+    publisher = getattr(_process_context, 'publish', None)
+    if publisher is not None:
+        publisher(*value)
+
+
 def load_ipython_extension(ipython):
     from .magics import ManganiteMagics
     init()
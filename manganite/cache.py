@@ -0,0 +1,76 @@
+import copy
+import threading
+from collections import OrderedDict
+
+from manganite import metrics
+
+
+# Per-session store of cell results, keyed by the cell number
+# and fingerprints of the values the cell loaded. Each entry holds
+# the values of the cell's stored variables after it finished.
+# The least recently used entries are evicted first, once there
+# are more than `max_entries` or their estimated size exceeds
+# `max_bytes`. Values are copied in and out, as cells may mutate
+# the values they load in place.
+class ResultCache():
+    max_entries = 128
+    max_bytes = 100 * 2**20
+
+
+    # sets the limits for the caches of all sessions
+    @classmethod
+    def configure(cls, max_entries=None, max_bytes=None):
+        if max_entries is not None:
+            cls.max_entries = max_entries
+        if max_bytes is not None:
+            cls.max_bytes = max_bytes
+
+
+    def __init__(self):
+        self.size = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            metrics.cache_misses.inc()
+            return None
+        metrics.cache_hits.inc()
+        return copy.deepcopy(entry[0])
+
+
+    # results that cannot be copied or would not fit are not cached
+    def put(self, key, stores):
+        try:
+            stores = copy.deepcopy(stores)
+        except (TypeError, copy.Error):
+            return
+        seen = set()
+        size = sum(metrics.estimate_size(value, seen) for value in stores.values())
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            self._entries[key] = (stores, size)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                metrics.cache_evictions.inc()
@@ -1,20 +1,36 @@
 import ast
+import copy
+import hashlib
+import itertools
+import os
 import re
 import sys
+import threading
+import time
 import traceback
+import types
 from collections import namedtuple
+from contextlib import contextmanager
 from datetime import date, datetime
 from shlex import split
 
 import ast_scope
 import panel as pn
 import param
+import numpy as np
 from pandas import DataFrame
+from pandas.util import hash_pandas_object
 from IPython.core.magic_arguments import MagicArgumentParser
 from IPython.core.error import UsageError
+from bokeh.io.doc import patch_curdoc
+from panel.io.model import hold
+from panel.io.state import set_curdoc
+from tornado.ioloop import IOLoop
 
-from manganite import Manganite
+from manganite import Manganite, _process_context, metrics
+from .cache import ResultCache
 from .file_picker import FilePicker
+from .scheduler import Job, interruptible, scheduler
 
 
 class BoolWrapper(param.Parameterized):
@@ -47,6 +63,45 @@ WrappableTypes = {
     DataFrame: DataFrameWrapper}
 
 
+# content-based identity of a value, equal for values that would
+# render the same, or None if the value's type is not supported
+def fingerprint(value):
+    if value is None or isinstance(value, (bool, int, float, str, date)):
+        return (type(value), value)
+    if isinstance(value, (list, tuple)):
+        items = tuple(fingerprint(v) for v in value)
+        return None if None in items else (type(value), items)
+    if isinstance(value, DataFrame):
+        try:
+            hashes = hash_pandas_object(value, index=True).to_numpy()
+        except (TypeError, ValueError): # unhashable cells, like lists
+            return None
+        digest = hashlib.sha1(hashes.tobytes()).hexdigest()
+        return (DataFrame, tuple(value.columns), tuple(map(str, value.dtypes)),
+            tuple(value.index.names), tuple(value.columns.names), digest)
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        digest = hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest()
+        return (np.ndarray, value.shape, value.dtype.str, digest)
+    if type(value).__module__.startswith('plotly.') and hasattr(value, 'to_json'):
+        return (type(value), hashlib.sha1(value.to_json().encode()).hexdigest())
+    return None
+
+
+# stands in for a wrapped variable when cells are evaluated
+# outside of the notebook namespace, so that nothing is propagated
+class Detached():
+    __slots__ = ['value']
+
+    def __init__(self, value):
+        self.value = value
+
+
+def unwrap(value):
+    if isinstance(value, (param.Parameterized, Detached)):
+        return getattr(value, 'value', None)
+    return value
+
+
 def inspect_var(ns: dict, name: str):
     assert name.isidentifier()
 
@@ -67,6 +122,19 @@ class CellTransformer(ast.NodeTransformer):
         self.loads = set()
         self.undef_stores = set()
         self.undef_loads = set()
+        self.hoistable = set()
+        self.nested = set()
+        self._depth = 0
+
+
+    # code in these nodes may run after the cell has finished
+    def visit_nested(self, node):
+        self._depth += 1
+        self.generic_visit(node)
+        self._depth -= 1
+        return node
+
+    visit_FunctionDef = visit_AsyncFunctionDef = visit_Lambda = visit_ClassDef = visit_GeneratorExp = visit_nested
 
 
     def visit_Name(self, node):
@@ -90,22 +158,298 @@ class CellTransformer(ast.NodeTransformer):
         if var_state != 'wrapped':
             return node
 
+        if self._depth or isinstance(node.ctx, ast.Del):
+            self.nested.add(node.id)
+        else:
+            self.hoistable.add(node.id)
+
         return ast.Attribute(
             value=ast.Name(id=node.id, ctx=ast.Load()),
             attr='value',
             ctx=node.ctx)
 
 
-CellTransformInfo = namedtuple('CellTransformInfo', ['source', 'stores', 'loads', 'new', 'undefined'])
+# replaces the `name.value` references emitted by CellTransformer
+# with plain variables, so that loops do not go through the wrapper
+class ValueHoister(ast.NodeTransformer):
+    def __init__(self, names, prefix):
+        self.names = names
+        self.prefix = prefix
+        self.store_lines = {}
+
+
+    def visit_Attribute(self, node):
+        self.generic_visit(node)
+        if node.attr != 'value' or not isinstance(node.value, ast.Name) or node.value.id not in self.names:
+            return node
+
+        if isinstance(node.ctx, ast.Store):
+            self.store_lines[node.value.id] = node.lineno
+        return ast.copy_location(ast.Name(id=self.prefix + node.value.id, ctx=node.ctx), node)
+
+
+def at_line(nodes, lineno):
+    for node in nodes:
+        for child in ast.walk(node):
+            child.lineno = child.end_lineno = lineno
+            child.col_offset = child.end_col_offset = 0
+    return nodes
+
+
+# compiles the transformed source of a cell, reading the wrapped
+# variables in `names` once before the cell and writing the changed
+# ones back once afterwards, so that dependents are updated only once;
+# the line numbers of the cell stay those of the transformed source
+def hoist_values(source, names, prefix):
+    tree = ast.parse(source)
+    if not len(names):
+        return compile(tree, '<string>', 'exec')
+
+    hoister = ValueHoister(names, prefix + 'value_')
+    tree = hoister.visit(tree)
+    names = sorted(names)
+    stored = sorted(hoister.store_lines)
+    local = lambda name: prefix + 'value_' + name
+    entry = lambda name: prefix + 'entry_' + name
+
+    prologue = at_line(ast.parse('\n'.join(
+        '{} = {} = {}.value'.format(local(name), entry(name), name) if name in stored
+        else '{} = {}.value'.format(local(name), name)
+        for name in names)).body, 1)
+    write_back = []
+    for name in stored:
+        write_back += at_line(ast.parse(
+            'if {0} is not {1}:\n    {2}.value = {0}'.format(local(name), entry(name), name)).body,
+            hoister.store_lines[name])
+    cleanup = at_line(ast.parse('del {}'.format(', '.join(
+        [local(name) for name in names] + [entry(name) for name in stored]))).body, 1)
+
+    if len(write_back):
+        cleanup = [ast.Try(body=write_back, handlers=[], orelse=[], finalbody=cleanup)]
+    tree.body = prologue + [ast.Try(body=tree.body or [ast.Pass()], handlers=[], orelse=[], finalbody=cleanup)]
+    ast.fix_missing_locations(tree)
+    return compile(tree, '<string>', 'exec')
+
+
+def names_in(node, stored):
+    if node is None:
+        return set()
+    return {child.id for child in ast.walk(node)
+        if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Store) == stored}
+
+
+# names a statement binds once it has run, besides those in nested blocks
+def bound_names(statement):
+    if isinstance(statement, ast.Assign):
+        return set().union(*(names_in(target, True) for target in statement.targets))
+    if isinstance(statement, ast.AnnAssign) and statement.value is not None:
+        return names_in(statement.target, True)
+    if isinstance(statement, ast.AugAssign):
+        return names_in(statement.target, True)
+    if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return {statement.name}
+    if isinstance(statement, (ast.Import, ast.ImportFrom)):
+        return {alias.asname or alias.name.split('.')[0] for alias in statement.names if alias.name != '*'}
+    return set()
+
+
+# names whose values a cell reads before assigning them,
+# which are all its results can depend on; assignments in
+# blocks that may not run only count within these blocks
+def input_names(source, loads):
+    inputs = set()
+
+    def read(assigned, *nodes):
+        for node in nodes:
+            inputs.update((names_in(node, False) & loads) - assigned)
+
+    def visit(statements, assigned):
+        assigned = set(assigned)
+        for statement in statements:
+            if isinstance(statement, (ast.For, ast.AsyncFor)):
+                read(assigned, statement.iter)
+                assigned |= names_in(statement.target, True)
+                visit(statement.body + statement.orelse, assigned)
+            elif isinstance(statement, (ast.With, ast.AsyncWith)):
+                for item in statement.items:
+                    read(assigned, item.context_expr)
+                    assigned |= names_in(item.optional_vars, True)
+                assigned = visit(statement.body, assigned)
+            elif isinstance(statement, (ast.If, ast.While)):
+                read(assigned, statement.test)
+                visit(statement.body, assigned)
+                visit(statement.orelse, assigned)
+            elif isinstance(statement, ast.Try):
+                visit(statement.body, assigned)
+                for handler in statement.handlers:
+                    read(assigned, handler.type)
+                    visit(handler.body, assigned | ({handler.name} if handler.name else set()))
+                visit(statement.orelse, assigned)
+                visit(statement.finalbody, assigned)
+            else:
+                read(assigned, statement)
+                # augmented assignments read their target first
+                if isinstance(statement, ast.AugAssign):
+                    inputs.update((names_in(statement.target, True) & loads) - assigned)
+                assigned |= bound_names(statement)
+        return assigned
+
+    visit(ast.parse(source).body, set())
+    return inputs
+
+
+# stands in for sys.stdout and sys.stderr once output has been redirected,
+# so that each thread writes to its own terminal, like the Log sidebar
+# of the session whose `%%mnn execute` cell the thread is running
+class ThreadOutput():
+    def __init__(self, default):
+        self.default = default
+
+
+    def target(self):
+        terminal = getattr(_output, 'terminal', None)
+        return self.default if terminal is None else terminal
+
+
+    def write(self, text):
+        return self.target().write(text)
+
+
+    def flush(self):
+        self.target().flush()
+
+
+    def __getattr__(self, name):
+        return getattr(self.target(), name)
+
+
+_output = threading.local()
+_output_lock = threading.Lock()
+
+
+@contextmanager
+def redirect_output(terminal):
+    with _output_lock:
+        if not isinstance(sys.stdout, ThreadOutput):
+            sys.stdout = ThreadOutput(sys.stdout)
+        if not isinstance(sys.stderr, ThreadOutput):
+            sys.stderr = ThreadOutput(sys.stderr)
+
+    previous = getattr(_output, 'terminal', None)
+    _output.terminal = terminal
+    try:
+        yield
+    finally:
+        terminal.flush()
+        _output.terminal = previous
+
+
+# sends all model changes made while re-evaluating cells
+# as a single combined patch once the outermost update finishes;
+# documents may only be held from the server's event loop
+@contextmanager
+def batch_updates(doc):
+    if doc is None or threading.current_thread() is not threading.main_thread():
+        yield
+    else:
+        with hold(doc):
+            yield
+
+
+
+CellTransformInfo = namedtuple('CellTransformInfo', ['source', 'stores', 'loads', 'new', 'undefined', 'code'])
+CellInfo = namedtuple('CellInfo', ['source', 'stores', 'loads', 'inputs', 'process', 'widget'])
+
+# values that cells share rather than own, which are neither copied nor fingerprinted
+SHARED_TYPES = (types.ModuleType, types.FunctionType, types.BuiltinFunctionType, type)
+
+SPECULATIVE_WIDGETS = (pn.widgets.IntSlider, pn.widgets.Select, pn.widgets.RadioBoxGroup)
+SPECULATION_RADIUS = 2 # slider steps in each direction
+SPECULATION_OPTIONS = 8 # nearest options of a select or radio group
+SPECULATION_IDLE_DELAY = 0.5 # seconds without cell evaluations anywhere on the server
 
 
 class CellManager():
+    # server-wide, speculative evaluation waits until all sessions are idle
+    _activity_lock = threading.Lock()
+    _running_cells = 0
+    _last_activity = 0
+
+
     def __init__(self, ns):
         self.ns = ns
         self.deferred = {}
         self.panels = {}
+        self.fingerprints = {}
         self.process_callbacks = {}
         self.cell_count = 0
+        self.cells = {}
+        self.evaluated = set()
+        self.cached_cells = set()
+        self.cache = ResultCache()
+        # wrapped variables referenced by functions or other code
+        # that may run while another cell is running; these are
+        # always read and written through their wrapper
+        self.nested_refs = set()
+        self._bindings = itertools.count()
+        self._speculation_lock = threading.Lock()
+        self._speculation_pending = set()
+        self._speculation_thread = None
+        # updates scheduled on the event loop that have not run yet
+        self._pending_lock = threading.Lock()
+        self._pending = 0
+        self._destroyed = False
+        # cells of a session first run on the server's event loop
+        self.io_loop = IOLoop.current()
+        # served notebooks run with their path as `__file__`
+        self.app = os.path.splitext(os.path.basename(ns.get('__file__', '')))[0]
+        Manganite.get_instance()._namespace = ns
+        if pn.state.curdoc:
+            pn.state.curdoc.on_session_destroyed(self.discard_pending)
+
+
+    @classmethod
+    @contextmanager
+    def track_activity(cls):
+        with cls._activity_lock:
+            cls._running_cells += 1
+            cls._last_activity = time.monotonic()
+        try:
+            yield
+        finally:
+            with cls._activity_lock:
+                cls._running_cells -= 1
+                cls._last_activity = time.monotonic()
+
+
+    @classmethod
+    def wait_until_idle(cls):
+        while True:
+            with cls._activity_lock:
+                idle_for = time.monotonic() - cls._last_activity
+                if cls._running_cells == 0 and idle_for >= SPECULATION_IDLE_DELAY:
+                    return
+            time.sleep(SPECULATION_IDLE_DELAY / 5)
+
+
+    # cache key of a cell evaluated with the current values in `ns`,
+    # or None if any of the input values cannot be fingerprinted
+    def input_key(self, cell_number, inputs, ns):
+        key = []
+        for name in sorted(inputs):
+            if name not in ns: # builtins
+                continue
+            value = ns[name]
+            if isinstance(value, FilePicker): # same path, possibly new contents
+                return None
+            if isinstance(value, SHARED_TYPES):
+                key.append((name, id(value)))
+                continue
+            value_fingerprint = fingerprint(unwrap(value))
+            if value_fingerprint is None:
+                return None
+            key.append((name, value_fingerprint))
+        return (cell_number, tuple(key))
 
 
     def transform(self, source) -> CellTransformInfo:
@@ -115,12 +459,22 @@ class CellManager():
         transformer = CellTransformer(scope_info, self.ns)
         transformed_tree = transformer.visit(source_tree)
         ast.fix_missing_locations(transformed_tree)
+        transformed_source = ast.unparse(transformed_tree)
+
+        self.nested_refs |= transformer.nested
+        # results of `%%mnn execute` cells are read by `manganite.publish()`
+        # while the cell runs, so they are assigned to the wrapper directly
+        hoistable = transformer.hoistable - self.nested_refs - self.process_callbacks.keys()
+        # bindings are globals of the notebook namespace, so each
+        # transformation gets its own names in case cells run concurrently
+        prefix = '_mnn_local{}_'.format(next(self._bindings))
         return CellTransformInfo(
-            ast.unparse(transformed_tree),
+            transformed_source,
             transformer.stores,
             transformer.loads,
             transformer.undef_stores,
-            transformer.undef_loads - transformer.undef_stores)
+            transformer.undef_loads - transformer.undef_stores,
+            hoist_values(transformed_source, hoistable, prefix))
 
 
     def wrap(self, name: str, widget_attrs=None):
@@ -192,8 +546,120 @@ class CellManager():
             elif var_type == DataFrame:
                 self.ns[name] = pn.widgets.Tabulator(self.ns[name])
 
+            if widget_attrs.get('speculate') and isinstance(self.ns[name], SPECULATIVE_WIDGETS):
+                self.add_speculation(name)
+
+
+    def add_speculation(self, name):
+        self.ns[name].param.watch(lambda event: self.speculate(name), ['value'])
+        if pn.state.curdoc:
+            pn.state.onload(lambda: self.speculate(name))
+
+
+    # cells that have to be re-evaluated after `name` changes, in notebook order
+    def downstream(self, name):
+        changed = {name}
+        chain = []
+        for cell_number, cell in self.cells.items():
+            if cell.process or cell.widget == name or cell_number not in self.evaluated:
+                continue
+            if cell.loads & changed:
+                chain.append(cell_number)
+                changed |= cell.stores
+        return chain
+
+
+    def speculation_candidates(self, widget):
+        if isinstance(widget, pn.widgets.IntSlider):
+            candidates = [widget.value]
+            for distance in range(1, SPECULATION_RADIUS + 1):
+                for value in (widget.value + distance * widget.step, widget.value - distance * widget.step):
+                    if widget.start <= value <= widget.end:
+                        candidates.append(value)
+            return candidates
+
+        options = list(widget.options)
+        current = options.index(widget.value) if widget.value in options else 0
+        nearest = sorted(range(len(options)), key=lambda i: abs(i - current))
+        return [options[i] for i in nearest[:SPECULATION_OPTIONS + 1]]
+
+
+    # evaluates the cells depending on `name` for another of its values
+    # in a copy of the namespace, filling the cache along the way;
+    # the values the cells load are copied, so that mutating them
+    # in place does not leak into the session
+    def precompute(self, name, value, chain):
+        loads = set().union(*(self.cells[cell_number].loads for cell_number in chain))
+        sandbox = {}
+        for k, v in list(self.ns.items()):
+            wrapped = isinstance(v, param.Parameterized)
+            v = unwrap(v)
+            if k in loads and not isinstance(v, SHARED_TYPES):
+                v = copy.deepcopy(v)
+            sandbox[k] = Detached(v) if wrapped else v
+        sandbox[name] = Detached(value)
+
+        for cell_number in chain:
+            cell = self.cells[cell_number]
+            key = self.input_key(cell_number, cell.inputs, sandbox)
+            if key is None:
+                return
+
+            cached = self.cache.get(key)
+            if cached is None:
+                exec(self.transform(cell.source).code, sandbox, sandbox)
+                metrics.speculative_runs.inc()
+                cached = {k: unwrap(sandbox[k]) for k in cell.stores if k in sandbox}
+                self.cache.put(key, cached)
+            else:
+                for k, v in cached.items():
+                    if isinstance(sandbox.get(k), Detached):
+                        sandbox[k].value = v
+                    else:
+                        sandbox[k] = v
+
+
+    def speculate(self, name):
+        with self._speculation_lock:
+            self._speculation_pending.add(name)
+            if self._speculation_thread is not None:
+                return
+            self._speculation_thread = threading.Thread(target=self._run_speculation, daemon=True)
+            self._speculation_thread.start()
+
+
+    def _run_speculation(self):
+        while True:
+            with self._speculation_lock:
+                # nothing is left to speed up once the session is closed
+                if self._destroyed or not len(self._speculation_pending):
+                    self._speculation_pending.clear()
+                    self._speculation_thread = None
+                    return
+                name = self._speculation_pending.pop()
+
+            widget = self.ns[name]
+            current = widget.value
+            chain = self.downstream(name)
+            self.cached_cells.update(chain)
+
+            for value in self.speculation_candidates(widget):
+                self.wait_until_idle()
+                if self._destroyed:
+                    break
+                # start over from the new value if the user has moved on
+                if widget.value != current:
+                    break
+                try:
+                    self.precompute(name, value, chain)
+                except Exception as err:
+                    pn.state.log('Speculative evaluation of {}={!r} failed: {!r}'.format(name, value, err), level='debug')
+                    break
+
 
     def process_exception(self, cell_number, cell_source, err: Exception):
+        if self._destroyed: # the session was closed while the cell was running
+            return
         mnn = Manganite.get_instance()
         error_class = err.__class__.__name__
         error_message = err.args[0]
@@ -214,27 +680,54 @@ class CellManager():
             error_message=error_message)
 
 
-    def add_cell(self, raw_source: str, process_var=None, widget_attrs=None):
+    def add_cell(self, raw_source: str, process_var=None, widget_attrs=None, cache=False):
         self.cell_count += 1
         cell_number = self.cell_count
+        if cache:
+            self.cached_cells.add(cell_number)
 
         try:
-            _, stores, loads, new, undefined = self.transform(raw_source)
+            _, stores, loads, new, undefined, _ = self.transform(raw_source)
         except Exception as err:
             self.process_exception(cell_number, raw_source, err)
             return
 
         defer = process_var is not None
+        inputs = input_names(raw_source, loads)
+        self.cells[cell_number] = CellInfo(
+            raw_source, stores, loads, inputs, process_var is not None,
+            widget_attrs['name'] if widget_attrs else None)
+
         first_run = True
         def run_cell(*events):
             nonlocal first_run
 
-            source = self.transform(raw_source).source
-            try:
-                exec(source, self.ns, self.ns)
-            except Exception as err:
-                self.process_exception(cell_number, source, err)
-                return
+            key = None
+            if cell_number in self.cached_cells:
+                key = self.input_key(cell_number, inputs, self.ns)
+            cached = self.cache.get(key) if key is not None else None
+
+            if cached is not None:
+                # wrapped variables notify their dependents as soon as they are
+                # assigned, so they are restored after all the other results
+                wrapped = lambda item: inspect_var(self.ns, item[0]) == 'wrapped'
+                for name, value in sorted(cached.items(), key=wrapped):
+                    self.set_value(name, value)
+            else:
+                source, *_, code = self.transform(raw_source)
+                start = time.perf_counter()
+                with self.track_activity():
+                    try:
+                        with interruptible():
+                            exec(code, self.ns, self.ns)
+                    except Exception as err:
+                        self.process_exception(cell_number, source, err)
+                        return
+                    finally:
+                        metrics.cell_seconds.observe(time.perf_counter() - start, app=self.app, cell=cell_number)
+
+                if key is not None:
+                    self.cache.put(key, {name: unwrap(self.ns[name]) for name in stores if name in self.ns})
 
             for name in stores:
                 var_state = inspect_var(self.ns, name)
@@ -248,7 +741,9 @@ class CellManager():
                 if var_state != 'undefined':
                     if name in self.deferred and len(self.deferred[name]):
                         for cb in self.deferred[name]:
-                            cb()
+                            # these are notified once the process has finished
+                            if cb not in self.process_callbacks.get(name, ()):
+                                self.on_loop(cb)()
                         self.deferred.pop(name)
 
             if widget_attrs and widget_attrs['name'] in self.ns:
@@ -257,14 +752,16 @@ class CellManager():
 
             if first_run:
                 first_run = False
+                self.evaluated.add(cell_number)
                 if not process_var:
                     for name in loads - stores:
                         var_state = inspect_var(self.ns, name)
-                        if var_state == 'wrapped':
+                        # results of `%%mnn execute` cells notify their dependents themselves
+                        if var_state == 'wrapped' and name not in self.process_callbacks:
                             # re-evaluate dependent cells only on actual change, except for file pickers,
                             # where the same name can refer to new file contents
                             onlychanged = not isinstance(self.ns[name], FilePicker)
-                            self.ns[name].param.watch(run_cell, ['value'], onlychanged=onlychanged)
+                            self.ns[name].param.watch(self.on_loop(run_cell), ['value'], onlychanged=onlychanged)
 
         deferred_deps = undefined & self.deferred.keys()
         process_deps = loads & self.process_callbacks.keys()
@@ -290,29 +787,186 @@ class CellManager():
         return run_cell
     
 
+    # Bokeh documents may only be modified from the server's event loop,
+    # so work from other threads is handed over to it; next tick callbacks
+    # of the document are not used, as they are lost when added while
+    # the loop holds the document
+    def schedule(self, doc, callback):
+        if doc is None:
+            callback()
+            return
+
+        async def run():
+            with self._pending_lock:
+                if self._destroyed:
+                    return
+                self._pending -= 1
+                metrics.propagation_queue_depth.dec()
+            async def locked(doc):
+                with set_curdoc(doc), patch_curdoc(doc), batch_updates(doc):
+                    callback()
+            if doc.session_context is None:
+                await locked(doc)
+            else:
+                await doc.session_context.with_locked_document(locked)
+
+        with self._pending_lock:
+            if self._destroyed:
+                return
+            self._pending += 1
+            metrics.propagation_queue_depth.inc()
+        self.io_loop.add_callback(run)
+
+
+    # callbacks still pending when the session is destroyed do not run
+    def discard_pending(self, session_context):
+        with self._pending_lock:
+            self._destroyed = True
+            metrics.propagation_queue_depth.dec(self._pending)
+            self._pending = 0
+
+
+    # dependent cells are always re-evaluated on the event loop,
+    # also when a change is made in the thread of an `%%mnn execute` cell
+    def on_loop(self, callback):
+        def run(*events):
+            doc = pn.state.curdoc
+            if doc is not None and threading.current_thread() is not threading.main_thread():
+                self.schedule(doc, lambda: callback(*events))
+                return
+            with batch_updates(doc):
+                callback(*events)
+        return run
+
+
+    def set_value(self, name, value):
+        if inspect_var(self.ns, name) == 'wrapped':
+            self.ns[name].value = value
+        else:
+            self.ns[name] = value
+
+
     def add_process_cell(self, args, raw_source):
         run_cell = self.add_cell(raw_source, process_var=args.returns)
         label = args.on[1]
 
         mnn = Manganite.get_instance()
-        def run_process(*events):
-            sys.stdout = mnn._optimizer_terminal
-            sys.stderr = mnn._optimizer_terminal
-            mnn._optimizer_terminal.write(
-                '\033[32;1m[{}]\nExecuting "{}"...\033[0m\n\n'.format(
+        terminal = mnn._optimizer_terminal
+
+        def notify_dependents():
+            for cb in list(self.process_callbacks[args.returns]):
+                cb()
+
+        # intermediate results are rendered on the event loop
+        # at most once per `--throttle` seconds, while the process
+        # keeps running in its own thread
+        lock = threading.Lock()
+        published = ()
+        published_over = None
+        render_pending = False
+        last_render = 0
+        render_timer = None
+        finished = True
+
+        def render_published():
+            nonlocal published, render_pending, last_render
+            with lock:
+                value, published = published, ()
+                render_pending = False
+                last_render = time.monotonic()
+                # the final result is rendered by finish_process
+                if finished:
+                    return
+                # a result the process has assigned since publishing
+                # is newer than the published one
+                if len(value) and unwrap(self.ns.get(args.returns)) is published_over:
+                    self.set_value(args.returns, value[0])
+            with redirect_output(terminal):
+                notify_dependents()
+
+        def publish(doc, *value):
+            nonlocal published, published_over, render_pending, render_timer
+            with lock:
+                published = value
+                published_over = unwrap(self.ns.get(args.returns))
+                if render_pending:
+                    return
+                render_pending = True
+                # within the throttle interval, the newest value
+                # is rendered as soon as the interval has passed
+                wait = last_render + args.throttle - time.monotonic()
+                if wait > 0:
+                    render_timer = threading.Timer(wait, self.schedule, args=(doc, render_published))
+                    render_timer.daemon = True
+                    render_timer.start()
+                    return
+            self.schedule(doc, render_published)
+
+        def start_publishing():
+            nonlocal finished
+            with lock:
+                finished = False
+
+        # drops intermediate results that are not rendered yet,
+        # so that they cannot replace the final result
+        def discard_published():
+            nonlocal published, published_over, render_pending, finished
+            with lock:
+                published = ()
+                published_over = None
+                render_pending = False
+                finished = True
+                if render_timer is not None:
+                    render_timer.cancel()
+
+        def finish_process():
+            with redirect_output(terminal):
+                notify_dependents()
+            terminal.write('\n\n')
+            button.disabled = False
+
+        def execute(doc):
+            with set_curdoc(doc):
+                terminal.write(
+                    '\033[32;1m[{}]\nExecuting "{}"...\033[0m\n\n'.format(
+                        datetime.now().isoformat(sep=' ', timespec='seconds'),
+                        label))
+                start_publishing()
+                _process_context.publish = lambda *value: publish(doc, *value)
+                metrics.processes_running.inc()
+                start = time.perf_counter()
+                try:
+                    with redirect_output(terminal):
+                        run_cell()
+                finally:
+                    metrics.process_seconds.observe(time.perf_counter() - start, label=label)
+                    metrics.processes_running.dec()
+                    _process_context.publish = None
+                    discard_published()
+                    self.schedule(doc, finish_process)
+
+        queue_position = 0
+        def report_position(doc, position):
+            nonlocal queue_position
+            if position == queue_position:
+                return
+            queue_position = position
+            if position > 0:
+                message = '\033[33m[{}]\n"{}" is waiting for a free slot, position {} in queue\033[0m\n\n'.format(
                     datetime.now().isoformat(sep=' ', timespec='seconds'),
-                    label))
-            try:
-                run_cell()
-                for cb in self.process_callbacks[args.returns]:
-                    cb()
-            finally:
-                sys.stdout.flush()
-                sys.stderr.flush()
-                mnn._optimizer_terminal.write('\n\n')
-                sys.stdout = sys.__stdout__
-                sys.stderr = sys.__stderr__
-        
+                    label,
+                    position)
+                self.schedule(doc, lambda: terminal.write(message))
+
+        def run_process(*events):
+            button.disabled = True
+            doc = pn.state.curdoc
+            scheduler.submit(Job(
+                session=doc,
+                run=lambda: execute(doc),
+                notify=lambda position: report_position(doc, position),
+                timeout=args.timeout))
+
         button = pn.widgets.Button(
             name=label,
             stylesheets=[':host { width: fit-content; }'])
@@ -326,9 +980,17 @@ class CellManager():
 
     def add_widget_cell(self, args, raw_source):
         def display_widget(widget):
+            # skip re-sending outputs identical to what the browser already shows
+            key = fingerprint(widget)
             if args.var in self.panels:
+                if key is not None and key == self.fingerprints.get(args.var):
+                    metrics.output_updates_suppressed.inc(var=args.var)
+                    return
+                self.fingerprints[args.var] = key
+                metrics.output_updates.inc(var=args.var)
                 self.panels[args.var].object = widget
             else:
+                self.fingerprints[args.var] = key
                 self.panels[args.var] = pn.panel(widget)
                 tab_grid = Manganite.get_instance().get_tab(args.tab)
                 grid_cell = pn.Column(
@@ -348,6 +1010,7 @@ class CellManager():
             'name': args.var,
             'type': args.type[0],
             'params': args.type[1] if len(args.type) > 1 else None,
+            'speculate': args.speculate,
             'display': display_widget}
         self.add_cell(raw_source, widget_attrs=widget)
 
@@ -360,6 +1023,8 @@ class CellManager():
         process_parser.add_argument('--on', type=str, nargs=2, required=True)
         process_parser.add_argument('--tab', type=str, required=False)
         process_parser.add_argument('--returns', type=str, required=True)
+        process_parser.add_argument('--throttle', type=float, required=False, default=1.0)
+        process_parser.add_argument('--timeout', type=float, required=False)
 
         widget_parser = subparsers.add_parser('widget')
         widget_parser.add_argument('--var', type=str, required=True)
@@ -368,6 +1033,9 @@ class CellManager():
         widget_parser.add_argument('--header', type=str, required=False)
         widget_parser.add_argument('--position', type=int, nargs=3,
             required=False, default=(-1, -1, 3))
+        widget_parser.add_argument('--speculate', action='store_true')
+
+        subparsers.add_parser('cache')
 
         argv = split(arg_line)
 
@@ -386,3 +1054,5 @@ class CellManager():
             self.add_process_cell(args, raw_source)
         elif args.magic_type == 'widget':
             self.add_widget_cell(args, raw_source)
+        elif args.magic_type == 'cache':
+            self.add_cell(raw_source, cache=True)
@@ -5,6 +5,82 @@ from panel import __version__ as pn_version
 from panel.command.serve import Serve as PnServe
 
 from manganite import __version__, preprocessor
+from manganite.cache import ResultCache
+from manganite.metrics import MetricsHandler
+from manganite.scheduler import scheduler
+
+
+class Serve(PnServe):
+    args = PnServe.args + (
+        ('--metrics', dict(
+            action='store_true',
+            help='Expose server metrics in Prometheus text format'
+        )),
+        ('--metrics-endpoint', dict(
+            action='store',
+            type=str,
+            default='/metrics',
+            help='URL path of the metrics endpoint (default: /metrics)'
+        )),
+        ('--max-jobs', dict(
+            action='store',
+            type=int,
+            help='Maximum number of `%%%%mnn execute` cells running at once across all sessions (default: number of CPUs)'
+        )),
+        ('--job-timeout', dict(
+            action='store',
+            type=float,
+            help='Default time limit in seconds for `%%%%mnn execute` cells (default: none)'
+        )),
+        ('--cache-size', dict(
+            action='store',
+            type=float,
+            help='Maximum estimated size in MiB of the cached cell results of each session (default: 100)'
+        )),
+    )
+
+
+    def customize_kwargs(self, args, server_kwargs):
+        kwargs = super().customize_kwargs(args, server_kwargs)
+        if args.metrics:
+            kwargs['extra_patterns'].append((args.metrics_endpoint, MetricsHandler))
+        return kwargs
+
+
+    def invoke(self, args):
+        scheduler.configure(max_jobs=args.max_jobs, timeout=args.job_timeout)
+        if args.cache_size is not None:
+            ResultCache.configure(max_bytes=int(args.cache_size * 2**20))
+        super().invoke(args)
+
+
+class LoadTest():
+    name = 'loadtest'
+    help = 'Replay scripted widget interactions against a local server with a growing number of sessions'
+
+
+    def __init__(self, parser):
+        parser.add_argument('notebook', help='notebook to serve with `mnn serve`')
+        parser.add_argument('--script', required=True,
+            help='JSON file with a list of interaction steps to replay in every session')
+        parser.add_argument('--sessions', type=int, nargs='+', default=[1, 5, 10],
+            help='numbers of concurrent sessions to test, one stage each')
+        parser.add_argument('--repeat', type=int, default=1,
+            help='how many times each session replays the script')
+        parser.add_argument('--port', type=int, default=5099)
+        parser.add_argument('--settle', type=float, default=0.25,
+            help='seconds without server patches after which an interaction counts as complete')
+        parser.add_argument('--timeout', type=float, default=60,
+            help='seconds to wait for the first server response to an interaction')
+        parser.add_argument('--output', help='also write the results as JSON to this file')
+        parser.add_argument('--serve-args', nargs=argparse.REMAINDER, default=[],
+            help='remaining arguments are passed on to `mnn serve`')
+
+
+    # the client imports all of Panel's models, which `mnn serve` does not need
+    def invoke(self, args):
+        from manganite.loadtest import run_load_test
+        run_load_test(args)
 
 
 def main():
@@ -13,10 +89,14 @@ def main():
 
     subs = parser.add_subparsers(title='subcommands')
 
-    serve_subparser = subs.add_parser(PnServe.name, help=PnServe.help)
-    serve_subcommand = PnServe(parser=serve_subparser)
+    serve_subparser = subs.add_parser(Serve.name, help=Serve.help)
+    serve_subcommand = Serve(parser=serve_subparser)
     serve_subparser.set_defaults(invoke=serve_subcommand.invoke)
 
+    loadtest_subparser = subs.add_parser(LoadTest.name, help=LoadTest.help)
+    loadtest_subcommand = LoadTest(parser=loadtest_subparser)
+    loadtest_subparser.set_defaults(invoke=loadtest_subcommand.invoke)
+
     if len(sys.argv) == 1:
         args = parser.parse_args(['--help'])
         args.invoke(args)
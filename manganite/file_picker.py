@@ -5,7 +5,7 @@ import param
 from panel.viewable import Viewer
 from pathvalidate import sanitize_filename
 
-from manganite import Manganite
+from manganite import Manganite, metrics
 
 
 class FilePicker(Viewer):
@@ -47,6 +47,7 @@ class FilePicker(Viewer):
             filename = sanitize_filename(self._input.filename)
             filepath = os.path.join(self._path, filename)
             self._input.save(filepath)
+            metrics.upload_bytes.inc(len(self._input.value))
 
             # trigger value change on the first upload
             # or a re-upload of the currently selected file
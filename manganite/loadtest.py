@@ -0,0 +1,373 @@
+import asyncio
+import importlib
+import json
+import os
+import pkgutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import panel.models
+from bokeh.client import pull_session
+from bokeh.core.serialization import Serializable
+from bokeh.document.events import MessageSentEvent
+from tornado.ioloop import IOLoop
+
+import manganite.grid # noqa: registers the Grid model
+
+
+# the client can only load documents whose model types it knows,
+# and Panel does not import all of its models upfront
+for module in pkgutil.iter_modules(panel.models.__path__):
+    try:
+        importlib.import_module('panel.models.' + module.name)
+    except ImportError:
+        pass
+
+
+Interaction = namedtuple('Interaction', ['locator', 'action', 'value', 'pause'])
+
+PERCENTILES = (50, 90, 99)
+
+
+# Bokeh events have no serializable representation on the Python side,
+# because normally only the browser sends them to the server
+class _ButtonClick(Serializable):
+    def __init__(self, model):
+        self.model = model
+
+
+    def to_serializable(self, serializer):
+        return {
+            'type': 'event',
+            'name': 'button_click',
+            'values': serializer.encode({'model': self.model})}
+
+
+def load_script(path):
+    with open(path) as f:
+        steps = json.load(f)
+
+    interactions = []
+    for step in steps:
+        if 'widget' in step:
+            locator = ('label', step['widget'], 0)
+        elif 'model' in step:
+            locator = ('model', step['model'], step.get('index', 0))
+        else:
+            raise ValueError('Each step needs either a "widget" label or a "model" type: {!r}'.format(step))
+
+        pause = step.get('pause', 0)
+        if step.get('click'):
+            interactions.append(Interaction(locator, 'click', None, pause))
+        elif 'edit' in step:
+            interactions.append(Interaction(locator, 'edit', step['edit'], pause))
+        elif 'values' in step:
+            interactions.extend(Interaction(locator, 'value', v, pause) for v in step['values'])
+        elif 'value' in step:
+            interactions.append(Interaction(locator, 'value', step['value'], pause))
+        else:
+            raise ValueError('Each step needs one of "value", "values", "edit" or "click": {!r}'.format(step))
+
+    return interactions
+
+
+def find_model(doc, locator):
+    kind, key, index = locator
+    # model ids are assigned sequentially, so sorting by them
+    # gives the order in which the server created the models
+    models = sorted(doc.models, key=lambda m: (len(m.id), m.id))
+
+    if kind == 'label':
+        matches = [m for m in models if key in (
+            getattr(m, 'title', None),
+            getattr(m, 'label', None),
+            getattr(m, 'name', None))
+            or list(getattr(m, 'labels', None) or []) == [key]]
+    else:
+        matches = [m for m in models if type(m).__name__ == key]
+
+    if index >= len(matches):
+        raise LookupError('No model matching {!r}'.format(locator[:2]))
+    return matches[index]
+
+
+# returns False without changing anything if the widget already
+# has the value, as the server would not respond to the change
+def apply_interaction(doc, interaction):
+    model = find_model(doc, interaction.locator)
+    value = interaction.value
+
+    if interaction.action == 'click':
+        doc.callbacks.trigger_on_change(MessageSentEvent(doc, 'bokeh_event', _ButtonClick(model)))
+        return True
+
+    if interaction.action == 'edit':
+        if model.source.data[value['column']][value['row']] == value['value']:
+            return False
+        model.source.patch({value['column']: [(value['row'], value['value'])]})
+        return True
+
+    if hasattr(model, 'value'):
+        attr, new = 'value', value
+    elif isinstance(getattr(model, 'active', None), list): # Checkbox
+        attr, new = 'active', [0] if value else []
+    elif hasattr(model, 'labels'): # RadioBoxGroup
+        attr, new = 'active', list(model.labels).index(value)
+    else: # Switch
+        attr, new = 'active', bool(value)
+
+    if getattr(model, attr) == new:
+        return False
+    setattr(model, attr, new)
+    return True
+
+
+class SimulatedClient():
+    def __init__(self, url, interactions, repeat, settle, timeout):
+        self.url = url
+        self.interactions = interactions
+        self.repeat = repeat
+        self.settle = settle
+        self.timeout = timeout
+
+        self.startup = None
+        self.latencies = []
+        self.timeouts = 0
+        self.unchanged = 0
+        self.error = None
+        self._last_patch = None
+
+
+    def run(self):
+        # each client gets its own event loop, so that
+        # the blocking Bokeh client API can run in a thread
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        io_loop = IOLoop.current()
+
+        start = time.perf_counter()
+        try:
+            session = pull_session(url=self.url, io_loop=io_loop)
+        except Exception as err:
+            self.error = err
+            io_loop.close(all_fds=True)
+            return
+        self.startup = time.perf_counter() - start
+
+        def on_change(event):
+            # only count patches sent by the server
+            if event.setter is session:
+                self._last_patch = time.perf_counter()
+
+        session.document.on_change(on_change)
+        io_loop.run_sync(lambda: self._run_session(session))
+        io_loop.close(all_fds=True)
+
+
+    async def _run_session(self, session):
+        receiver = asyncio.ensure_future(self._receive(session))
+        await self._replay(session)
+        await receiver
+
+
+    # Bokeh's own client loop awaits itself again for every message
+    # it receives, so its stack grows over the lifetime of a session
+    # until it hits the recursion limit; this loop does the same
+    # through the connection's private API, but without nesting
+    async def _receive(self, session):
+        connection = session._connection
+        while True:
+            message = await connection._pop_message()
+            if message is None: # closed
+                return
+            if message.msgtype == 'PATCH-DOC':
+                session._handle_patch(message)
+
+
+    async def _replay(self, session):
+        try:
+            for _ in range(self.repeat):
+                for interaction in self.interactions:
+                    if interaction.pause:
+                        await asyncio.sleep(interaction.pause)
+                    await self._interact(session, interaction)
+        except Exception as err:
+            self.error = err
+        finally:
+            session.close()
+
+
+    # latency is the time until the last patch of the burst
+    # that the server sends back in response to an interaction
+    async def _interact(self, session, interaction):
+        self._last_patch = None
+        sent = time.perf_counter()
+        if not apply_interaction(session.document, interaction):
+            self.unchanged += 1
+            return
+
+        while True:
+            await asyncio.sleep(self.settle / 5)
+            now = time.perf_counter()
+            if self._last_patch is None:
+                if now - sent > self.timeout:
+                    self.timeouts += 1
+                    return
+            elif now - self._last_patch >= self.settle:
+                self.latencies.append(self._last_patch - sent)
+                return
+
+
+class ProcessSampler():
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+
+    def cpu_time(self):
+        with open('/proc/{}/stat'.format(self.pid)) as f:
+            # the command name in field 2 may contain spaces
+            fields = f.read().rsplit(')', 1)[1].split()
+        utime, stime = int(fields[11]), int(fields[12])
+        return (utime + stime) / os.sysconf('SC_CLK_TCK')
+
+
+    def rss(self):
+        with open('/proc/{}/status'.format(self.pid)) as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+
+    def __enter__(self):
+        self.peak_rss = self.rss()
+        self._cpu_start = self.cpu_time()
+        self._wall_start = time.perf_counter()
+        self._thread.start()
+        return self
+
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.cpu = self.cpu_time() - self._cpu_start
+        self.wall = time.perf_counter() - self._wall_start
+        self.final_rss = self.rss()
+
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, self.rss())
+
+
+def percentile(values, p):
+    if not len(values):
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def run_stage(url, pid, n, interactions, args):
+    clients = [SimulatedClient(url, interactions, args.repeat, args.settle, args.timeout) for _ in range(n)]
+    threads = [threading.Thread(target=c.run, daemon=True) for c in clients]
+
+    with ProcessSampler(pid) as sampler:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    latencies = [l for c in clients for l in c.latencies]
+    startups = [c.startup for c in clients if c.startup is not None]
+    return {
+        'sessions': n,
+        'interactions': len(latencies),
+        'timeouts': sum(c.timeouts for c in clients),
+        'unchanged': sum(c.unchanged for c in clients),
+        'errors': [repr(c.error) for c in clients if c.error is not None],
+        'latency': {'p{}'.format(p): percentile(latencies, p) for p in PERCENTILES},
+        'startup': {'p{}'.format(p): percentile(startups, p) for p in PERCENTILES},
+        'throughput': len(latencies) / sampler.wall,
+        'wall_time': sampler.wall,
+        'cpu_percent': 100 * sampler.cpu / sampler.wall,
+        'peak_rss': sampler.peak_rss,
+        'final_rss': sampler.final_rss}
+
+
+def wait_for_port(port, server, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError('mnn serve exited with code {}'.format(server.returncode))
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('mnn serve did not start listening on port {}'.format(port))
+
+
+def format_report(results):
+    ms = lambda v: '-' if v is None else '{:.0f}'.format(1000 * v)
+    mib = lambda v: '{:.0f}'.format(v / 2**20)
+
+    header = ('sessions', 'ok', 'timeouts', 'unchanged', 'errors', 'startup p50',
+        'p50 ms', 'p90 ms', 'p99 ms', 'req/s', 'cpu %', 'peak rss MiB')
+    rows = [header]
+    for r in results:
+        rows.append((
+            str(r['sessions']),
+            str(r['interactions']),
+            str(r['timeouts']),
+            str(r['unchanged']),
+            str(len(r['errors'])),
+            ms(r['startup']['p50']),
+            ms(r['latency']['p50']),
+            ms(r['latency']['p90']),
+            ms(r['latency']['p99']),
+            '{:.2f}'.format(r['throughput']),
+            '{:.0f}'.format(r['cpu_percent']),
+            mib(r['peak_rss'])))
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    return '\n'.join('  '.join(cell.rjust(w) for cell, w in zip(row, widths)) for row in rows)
+
+
+def run_load_test(args):
+    interactions = load_script(args.script)
+    app = os.path.splitext(os.path.basename(args.notebook))[0]
+    url = 'http://127.0.0.1:{}/{}'.format(args.port, app)
+
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'manganite.command', 'serve', args.notebook,
+            '--address', '127.0.0.1', '--port', str(args.port),
+            '--allow-websocket-origin', '127.0.0.1:{}'.format(args.port)] + args.serve_args,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL)
+
+    results = []
+    try:
+        wait_for_port(args.port, server)
+        for n in args.sessions:
+            print('Running {} concurrent session(s)...'.format(n), file=sys.stderr)
+            results.append(run_stage(url, server.pid, n, interactions, args))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(format_report(results))
+    for r in results:
+        for error in sorted(set(r['errors'])):
+            print('{} session(s): {}'.format(r['sessions'], error), file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,309 @@
+import pickle
+import sys
+import threading
+import time
+import types
+from collections import deque
+
+import param
+from pandas import DataFrame
+from tornado.web import RequestHandler
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PROCESS_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+SESSION_MEMORY_INTERVAL = 15 # seconds between estimates of the session memory
+
+REGISTRY = []
+
+
+def format_labels(labels):
+    if not len(labels):
+        return ''
+    escape = lambda v: str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return '{' + ','.join('{}="{}"'.format(k, escape(v)) for k, v in labels) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric():
+    type = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError('{} expects labels {}, got {}'.format(self.name, self.labels, tuple(labels)))
+        return tuple((name, labels[name]) for name in self.labels)
+
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+    def render(self):
+        lines = [
+            '# HELP {} {}'.format(self.name, self.help),
+            '# TYPE {} {}'.format(self.name, self.type)]
+        for name, labels, value in self.samples():
+            lines.append('{}{} {}'.format(name, format_labels(labels), format_value(value)))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        if not len(self.labels):
+            self._values[()] = 0
+
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def __init__(self, name, help, labels=(), collect=None):
+        super().__init__(name, help, labels)
+        self._collect = collect
+
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+    # gauges with a `collect` function are evaluated on every scrape,
+    # which should yield `(labels, value)` pairs
+    def samples(self):
+        if self._collect is None:
+            return super().samples()
+        return [(self.name, self._key(labels), value) for labels, value in self._collect()]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0))
+            counts = list(counts)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+
+    def samples(self):
+        samples = []
+        for _, key, (counts, total) in super().samples():
+            for bound, count in zip(self.buckets, counts):
+                samples.append((self.name + '_bucket', key + (('le', format_value(bound)),), count))
+            samples.append((self.name + '_sum', key, total))
+            samples.append((self.name + '_count', key, counts[-1]))
+        return samples
+
+
+def render():
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+# rough size of the values a session holds in its notebook namespace,
+# counting the data behind DataFrames and arrays but not shared objects
+# like modules, functions or classes; objects reachable from several
+# values are counted once per `seen` set
+def estimate_size(value, seen=None):
+    if seen is None:
+        seen = set()
+    if isinstance(value, param.Parameterized):
+        value = getattr(value, 'value', None)
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    if isinstance(value, DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(getattr(value, 'nbytes', None), int):
+        return value.nbytes
+    if isinstance(value, (str, bytes, bytearray, int, float, complex, bool, type(None))):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            estimate_size(key, seen) + estimate_size(item, seen)
+            for key, item in list(value.items()))
+    if isinstance(value, (list, tuple, set, frozenset, deque)):
+        return sys.getsizeof(value) + sum(estimate_size(item, seen) for item in list(value))
+    # other objects, e.g. figures, are measured by their
+    # serialized size, which includes the data they refer to
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+def estimate_namespace_size(ns):
+    shared_types = (types.ModuleType, types.FunctionType, types.BuiltinFunctionType, type)
+    seen = set()
+    return sum(
+        estimate_size(value, seen) for name, value in list(ns.items())
+        if not name.startswith('_') and not isinstance(value, shared_types))
+
+
+def session_id(doc):
+    return doc.session_context.id if doc.session_context else str(id(doc))
+
+
+def collect_active_sessions():
+    from manganite import Manganite
+    yield {}, len(Manganite._server_instances)
+
+
+# measuring all namespaces can take a while, so it is done periodically
+# in the background rather than on the event loop when metrics are scraped
+class SessionMemorySampler():
+    def __init__(self, interval=SESSION_MEMORY_INTERVAL):
+        self.interval = interval
+        self.sizes = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+
+    def _run(self):
+        from manganite import Manganite
+        while True:
+            sizes = {}
+            for doc, mnn in list(Manganite._server_instances.items()):
+                if mnn._namespace is None:
+                    continue
+                try:
+                    sizes[doc] = estimate_namespace_size(mnn._namespace)
+                except Exception: # values changed by a running process
+                    pass
+            self.sizes = sizes
+            time.sleep(self.interval)
+
+
+session_memory_sampler = SessionMemorySampler()
+
+
+def collect_session_memory():
+    from manganite import Manganite
+    session_memory_sampler.start()
+    for doc, size in list(session_memory_sampler.sizes.items()):
+        # skip sessions closed since the last sample
+        if doc in Manganite._server_instances:
+            yield {'session': session_id(doc)}, size
+
+
+def collect_queued_jobs():
+    from manganite.scheduler import scheduler
+    yield {}, scheduler.queued
+
+
+active_sessions = Gauge(
+    'manganite_active_sessions',
+    'Number of dashboard sessions currently open on this server',
+    collect=collect_active_sessions)
+
+session_memory = Gauge(
+    'manganite_session_memory_bytes',
+    'Estimated size of the values held in a session\'s notebook namespace, sampled periodically',
+    labels=['session'],
+    collect=collect_session_memory)
+
+cell_seconds = Histogram(
+    'manganite_cell_execution_seconds',
+    'Time spent executing a notebook cell, by app and cell number',
+    labels=['app', 'cell'])
+
+propagation_queue_depth = Gauge(
+    'manganite_propagation_queue_depth',
+    'Dependent cell updates scheduled on the event loop but not yet run')
+
+process_seconds = Histogram(
+    'manganite_process_duration_seconds',
+    'Duration of `%%mnn execute` cells, by button label',
+    labels=['label'],
+    buckets=PROCESS_BUCKETS)
+
+processes_running = Gauge(
+    'manganite_processes_running',
+    'Number of `%%mnn execute` cells currently running')
+
+jobs_queued = Gauge(
+    'manganite_jobs_queued',
+    'Number of `%%mnn execute` cells waiting for a free slot',
+    collect=collect_queued_jobs)
+
+output_updates = Counter(
+    'manganite_output_updates_total',
+    'Updated outputs of `%%mnn widget` cells sent to the browser, by variable',
+    labels=['var'])
+
+output_updates_suppressed = Counter(
+    'manganite_output_updates_suppressed_total',
+    'Outputs of `%%mnn widget` cells not sent because they were unchanged, by variable',
+    labels=['var'])
+
+cache_hits = Counter(
+    'manganite_cell_cache_hits_total',
+    'Cell evaluations answered from a session\'s result cache')
+
+cache_misses = Counter(
+    'manganite_cell_cache_misses_total',
+    'Cell evaluations of cacheable cells that had to be executed')
+
+cache_evictions = Counter(
+    'manganite_cell_cache_evictions_total',
+    'Results evicted from session result caches')
+
+speculative_runs = Counter(
+    'manganite_speculative_runs_total',
+    'Cells executed in the background for values a widget might take next')
+
+exceptions = Counter(
+    'manganite_exceptions_total',
+    'Exceptions raised by notebook cells, by exception class',
+    labels=['error_class'])
+
+upload_bytes = Counter(
+    'manganite_upload_bytes_total',
+    'Total size of files uploaded through file widgets')
+
+
+class MetricsHandler(RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', CONTENT_TYPE)
+        self.write(render())
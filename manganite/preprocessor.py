@@ -38,6 +38,15 @@ class TransformManganiteMagicsPreprocessor(nbconvert.preprocessors.Preprocessor)
                 _mnn_cell_mgr = CellManager(globals())""".format(title.group(1) if title else None, description))
         })
 
+        nb.cells.append({
+            'id': str(uuid4()),
+            'cell_type': 'code',
+            'outputs': [],
+            'execution_count': None,
+            'metadata': {'tags': ['mnn-ignore']},
+            'source': '_mnn_import.finalize()'
+        })
+
         return super().preprocess(nb, resources)
 
 
@@ -0,0 +1,178 @@
+import ctypes
+import os
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+
+class JobTimeoutError(TimeoutError):
+    # raised asynchronously in the job's thread, which instantiates
+    # the class without arguments, so it needs a default message
+    def __init__(self, *args):
+        super().__init__(*(args or ('Execution exceeded its time limit',)))
+
+
+class Job():
+    def __init__(self, session, run, notify=None, timeout=None):
+        self.session = session
+        self.run = run
+        self.notify = notify
+        self.timeout = timeout
+        self.thread = None
+        self._lock = threading.Lock()
+        self._expired = False
+        self._interruptible = False
+
+
+    # the timeout is only raised while the cell's code runs, so that
+    # the bookkeeping around it (re-enabling the button, metrics) completes
+    def expire(self):
+        with self._lock:
+            self._expired = True
+            if self._interruptible:
+                self._set_async_exc(ctypes.py_object(JobTimeoutError))
+
+
+    @contextmanager
+    def interruptible(self):
+        with self._lock:
+            if self._expired:
+                raise JobTimeoutError()
+            self._interruptible = True
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._interruptible = False
+                if self._expired:
+                    # drops the exception if it has not been raised yet
+                    self._set_async_exc(None)
+
+
+    def _set_async_exc(self, exc):
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(self.thread.ident), exc)
+
+
+    def execute(self):
+        _current.job = self
+        try:
+            self.run()
+        finally:
+            _current.job = None
+
+
+_current = threading.local()
+
+
+# marks the code of the current job that a timeout may interrupt;
+# does nothing outside of a job
+@contextmanager
+def interruptible():
+    job = getattr(_current, 'job', None)
+    if job is None:
+        yield
+    else:
+        with job.interruptible():
+            yield
+
+
+# Runs `%%mnn execute` cells of all sessions in a bounded number
+# of threads. Waiting jobs are taken from each session in turn,
+# so that one session cannot starve the others by queueing many jobs.
+class JobScheduler():
+    def __init__(self, max_jobs=None, timeout=None):
+        self._lock = threading.Lock()
+        self._queues = OrderedDict()
+        self._running = set()
+        self.configure(max_jobs, timeout)
+
+
+    def configure(self, max_jobs=None, timeout=None):
+        self.max_jobs = max_jobs or os.cpu_count() or 1
+        self.timeout = timeout
+
+
+    @property
+    def queued(self):
+        with self._lock:
+            return sum(len(queue) for queue in self._queues.values())
+
+
+    @property
+    def running(self):
+        with self._lock:
+            return len(self._running)
+
+
+    def submit(self, job):
+        with self._lock:
+            self._queues.setdefault(job.session, deque()).append(job)
+            started = self._dispatch()
+            waiting = self._waiting()
+        self._notify(started, waiting)
+
+
+    # drops waiting jobs of a session, e.g. when it is closed;
+    # its running jobs are left to finish
+    def cancel(self, session):
+        with self._lock:
+            cancelled = list(self._queues.pop(session, ()))
+            waiting = self._waiting()
+        self._notify([], waiting)
+        return cancelled
+
+
+    def _dispatch(self):
+        started = []
+        while len(self._running) < self.max_jobs and len(self._queues):
+            session, queue = self._queues.popitem(last=False)
+            job = queue.popleft()
+            if len(queue):
+                self._queues[session] = queue
+
+            job.thread = threading.Thread(target=self._run, args=(job,), daemon=True)
+            self._running.add(job)
+            started.append(job)
+
+        for job in started:
+            job.thread.start()
+        return started
+
+
+    # waiting jobs in the order they will be started
+    def _waiting(self):
+        queues = [list(queue) for queue in self._queues.values()]
+        rounds = max(map(len, queues), default=0)
+        return [queue[i] for i in range(rounds) for queue in queues if i < len(queue)]
+
+
+    def _notify(self, started, waiting):
+        for job in started:
+            if job.notify is not None:
+                job.notify(0)
+        for position, job in enumerate(waiting, start=1):
+            if job.notify is not None:
+                job.notify(position)
+
+
+    def _run(self, job):
+        timeout = job.timeout if job.timeout is not None else self.timeout
+        timer = None
+        if timeout:
+            timer = threading.Timer(timeout, job.expire)
+            timer.daemon = True
+            timer.start()
+
+        try:
+            job.execute()
+        finally:
+            if timer is not None:
+                timer.cancel()
+            with self._lock:
+                self._running.discard(job)
+                started = self._dispatch()
+                waiting = self._waiting()
+            self._notify(started, waiting)
+
+
+scheduler = JobScheduler()